@@ -5,19 +5,104 @@ Clean, responsive interface optimized for technical documentation
 """
 
 from flask import Flask, render_template, request, send_from_directory, jsonify
+from jinja2 import FileSystemBytecodeCache
 import os
+import sys
+import json
+import signal
 import markdown
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
-import glob
+import mmap
+import heapq
+from pathlib import PurePosixPath
+import threading
+import queue
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# pyserial is only needed by the diagnostic wizard's run_command endpoint
+try:
+    import serial
+    import serial.tools.list_ports
+    SERIAL_AVAILABLE = True
+except ImportError:
+    SERIAL_AVAILABLE = False
+
+# waitress is optional; without it the threaded Werkzeug server is used
+try:
+    from waitress import serve
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
 
 app = Flask(__name__)
 
+# Persist compiled templates across restarts (per-user temp directory) so cold renders skip parsing
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
 # Configuration
 ROOT_PATH = '.'
 DOCS_PATH = 'docs'
 PORT = 3000
-DEBUG = True
+DEBUG = os.environ.get('LCARS_DEBUG') == '1'  # Set LCARS_DEBUG=1 for the Werkzeug debugger and reloader
+SERVER_THREADS = 16  # waitress worker threads when not in debug mode
+PORTS_CACHE_SECONDS = 2  # How long a serial port enumeration is reused between wizard commands
+SERIAL_IDLE_SECONDS = 30  # Release the controller port after this long without commands so uploads/monitors can open it
+RECENT_DOCS_LIMIT = 8  # Most recently modified docs shown on the dashboard
+SCAN_TTL = 5  # Seconds a document scan is reused before touching the disk again
+SCAN_HEAD_CHARS = 4096  # Enough of each file for categorization and preview
+SCAN_WORKERS = 8  # Threads used to read files during a scan
+PRERENDER_DOCS = True  # Render document HTML in the background after each scan
+LARGE_DOC_BYTES = 64 * 1024  # Documents above this size are searched through mmap
+WIZARD_LOG_DIR = 'wizard_logs'
+WIZARD_LOG_IDLE_SECONDS = 300  # Close a log handle after this long without events
+WIZARD_LOG_DRAIN_SECONDS = 0.5  # How often queued wizard log lines are written to their files
+WIZARD_LOG_FLUSH_SECONDS = 30  # How often written lines are flushed to disk
+WIZARD_LOG_BATCH = 1000  # Queued lines per drain; a full batch also forces a flush
+WIZARD_LOG_URGENT_EVENTS = {'command_error', 'session_complete'}  # Wizard events flushed to disk at once
+SCAN_SKIP_DIRS = {'__pycache__', 'node_modules', 'venv', 'templates', 'static', 'wizard_logs'}
+
+def _compile_keyword_groups(groups):
+    """Compile ordered (name, keywords) groups into one regex; match().lastgroup names the first group that hits"""
+    # Each group is a zero-width lookahead at position 0, so groups are tried in priority order
+    return re.compile('|'.join(
+        f"(?P<{name}>(?=.*(?:{'|'.join(re.escape(kw) for kw in keywords)})))"
+        for name, keywords in groups
+    ), re.DOTALL)
+
+# Filename keywords per category, highest priority first
+CATEGORY_PATTERN = _compile_keyword_groups([
+    ('Emergency', ['error', 'emergency', 'safety', 'mill_lamp', 'fault', 'alarm']),      # Emergency/Safety
+    ('Hardware', ['pin', 'hardware', 'arduino', 'pressure', 'relay', 'sensor']),         # Physical systems
+    ('Operations', ['setup', 'install', 'deploy', 'config', 'command']),                 # Operations and setup
+    ('Monitoring', ['monitor', 'test', 'diagnostic', 'log', 'telemetry']),               # Monitoring and diagnostics
+    ('Development', ['api', 'interface', 'protocol', 'serial', 'code'])                  # Development and technical
+])
+
+# Filename keywords per emergency-access priority (group p<N> -> priority N)
+PRIORITY_PATTERN = _compile_keyword_groups([
+    ('p1', ['error', 'emergency', 'safety', 'mill_lamp', 'system_test']),  # Emergency/Safety
+    ('p2', ['pin', 'pressure', 'hardware', 'arduino']),                    # Hardware troubleshooting
+    ('p3', ['setup', 'command', 'deploy'])                                 # Operations and commands
+])
+
+# Shared markdown converter - building the extension pipeline is the expensive part
+_markdown = markdown.Markdown(extensions=[
+    'markdown.extensions.tables',
+    'markdown.extensions.fenced_code', 
+    'markdown.extensions.toc',
+    'markdown.extensions.codehilite'
+])
+_markdown_lock = threading.Lock()
+
+@lru_cache(maxsize=256)
+def _read_document(filepath, mtime):
+    """Read a whole document; keyed on mtime so edited files are re-read automatically"""
+    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
 
 @app.context_processor
 def inject_globals():
@@ -27,13 +112,28 @@ def inject_globals():
         'current_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
 
+@app.template_filter('ts')
+def format_timestamp(value, fmt='%Y-%m-%d %H:%M'):
+    """Format an epoch timestamp for display; documents keep raw st_mtime floats"""
+    return datetime.fromtimestamp(value).strftime(fmt)
+
 class DocServer:
     def __init__(self, root_path='.', docs_path='docs'):
         self.root_path = root_path
         self.docs_path = docs_path
         self.last_scan = datetime.now()
         self.documents = []
-        self.docs_cache = {}
+        self.docs_cache = {}  # filepath -> (mtime_ns, size, doc)
+        self.by_url = {}  # URL path variant -> doc
+        self.scan_signature = None  # (path, mtime, size) of every file in the last scan
+        self.by_category = {}  # category -> docs in scan order
+        self.recent_docs = []  # newest docs first, RECENT_DOCS_LIMIT at most
+        self.category_counts = {}  # category -> number of docs
+        self.critical_docs = {}  # emergency dashboard buckets, 6 docs per category at most
+        self.total_size_kb = 0
+        self.html_cache = {}  # filepath -> (mtime, content, html)
+        self.prerender_thread = None
+        self.scan_lock = threading.Lock()
         
         # Define categories and their icons
         self.categories = {
@@ -45,51 +145,41 @@ class DocServer:
             'Reference': {'icon': '📖', 'color': '#607D8B', 'priority': 6}
         }
     
+    def documents_snapshot(self):
+        """Get the scanned document list, rescanning only when the last scan is older than SCAN_TTL"""
+        if self._scan_is_stale():
+            # Concurrent requests wait for one rescan instead of each walking the tree
+            with self.scan_lock:
+                if self._scan_is_stale():
+                    self.scan_all_documents()
+        return self.documents
+    
+    def _scan_is_stale(self):
+        """True when there are no documents yet or the last scan is older than SCAN_TTL"""
+        return not self.documents or datetime.now() - self.last_scan >= timedelta(seconds=SCAN_TTL)
+    
     def scan_all_documents(self):
         """Scan for all markdown documents in project"""
         documents = []
+        docs_cache = {}
         
-        # Scan patterns for markdown files
-        patterns = [
-            os.path.join(self.root_path, '*.md'),
-            os.path.join(self.docs_path, '*.md'),
-            os.path.join(self.root_path, '*', '*.md')
-        ]
+        entries = list(self._iter_markdown_files())
         
-        seen_files = set()
+        # Nothing added, removed or modified since the last scan: keep the current documents and indices
+        signature = self._tree_signature(entries)
+        if self.documents and signature == self.scan_signature:
+            self.last_scan = datetime.now()
+            return self.documents
         
-        for pattern in patterns:
-            for filepath in glob.glob(pattern):
-                if filepath in seen_files:
-                    continue
-                seen_files.add(filepath)
-                
-                try:
-                    filename = os.path.basename(filepath)
-                    relative_path = os.path.relpath(filepath, self.root_path)
-                    
-                    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                    
-                    # Get file stats
-                    stat = os.stat(filepath)
-                    
-                    doc = {
-                        'name': self._format_doc_name(filename),
-                        'filename': filename,
-                        'filepath': filepath,
-                        'relative_path': relative_path,
-                        'category': self._categorize_document(filename, content),
-                        'size': stat.st_size,
-                        'size_kb': round(stat.st_size / 1024, 1),
-                        'modified': datetime.fromtimestamp(stat.st_mtime),
-                        'content_preview': self._get_content_preview(content),
-                        'url_safe_name': self._make_url_safe(relative_path)
-                    }
-                    documents.append(doc)
-                    
-                except Exception as e:
-                    print(f"Error reading {filepath}: {e}")
+        # File reads are I/O-bound, so overlap them across a small thread pool (map keeps scan order)
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+            loaded = list(executor.map(self._load_document, entries))
+        
+        for entry in loaded:
+            if entry:
+                doc = entry[2]
+                docs_cache[doc['filepath']] = entry
+                documents.append(doc)
         
         # Sort by category priority, then name
         documents.sort(key=lambda x: (
@@ -98,18 +188,147 @@ class DocServer:
         ))
         
         self.documents = documents
+        self.docs_cache = docs_cache
+        self.scan_signature = signature
+        self.by_url = self._build_url_index(documents)
+        
+        # Dashboard indices are pure functions of the document list, so build them once per scan
+        by_category = {}
+        for doc in documents:
+            by_category.setdefault(doc['category'], []).append(doc)
+        self.by_category = by_category
+        self.category_counts = {category: len(docs) for category, docs in by_category.items()}
+        
+        # Category lists are already sorted by name within the scan order
+        self.critical_docs = {category: by_category[category][:6]  # Max 6 docs per category
+                              for category in ['Emergency', 'Hardware', 'Operations']
+                              if category in by_category}
+        self.total_size_kb = sum(doc['size_kb'] for doc in documents)
+        self.recent_docs = heapq.nlargest(RECENT_DOCS_LIMIT, documents, key=lambda x: x['mtime'])
         self.last_scan = datetime.now()
+        
+        if PRERENDER_DOCS:
+            self.start_prerender(documents)
         return documents
     
-    def _format_doc_name(self, filename):
-        """Format filename into readable document name"""
-        name = filename.replace('.md', '').replace('_', ' ').replace('-', ' ')
-        return ' '.join(word.capitalize() for word in name.split())
+    def start_prerender(self, documents):
+        """Render the given documents on a daemon thread unless a prerender pass is already running"""
+        if self.prerender_thread and self.prerender_thread.is_alive():
+            return
+        self.prerender_thread = threading.Thread(target=self._prerender_all, args=(documents,), daemon=True)
+        self.prerender_thread.start()
+    
+    def _prerender_all(self, documents):
+        """Fill html_cache so first document views skip markdown conversion"""
+        for doc in documents:
+            try:
+                self.render_document(doc['filepath'])
+            except Exception as e:
+                print(f"Error pre-rendering {doc['filepath']}: {e}")
+    
+    def _load_document(self, entry):
+        """Build the (mtime_ns, size, doc) cache entry for one DirEntry, or None if it can't be read"""
+        filepath = os.path.normpath(entry.path)
+        
+        try:
+            # Get file stats (cached on the DirEntry by scandir)
+            stat = entry.stat()
+            
+            # Unchanged files reuse their cached entry without being re-read
+            cached = self.docs_cache.get(filepath)
+            # Compare integer nanoseconds; float st_mtime can round away sub-microsecond edits
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                return cached
+            
+            filename = os.path.basename(filepath)
+            relative_path = os.path.relpath(filepath, self.root_path)
+            url_path = PurePosixPath(relative_path.replace('\\', '/'))
+            
+            # Only the head of the file feeds categorization and preview
+            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read(SCAN_HEAD_CHARS)
+            
+            doc = {
+                'name': self._format_doc_name(url_path.stem),
+                'filename': filename,
+                'stem': url_path.stem,
+                'filepath': filepath,
+                'relative_path': relative_path,
+                'category': self._categorize_document(filename, content),
+                'size': stat.st_size,
+                'size_kb': round(stat.st_size / 1024, 1),
+                'mtime': stat.st_mtime,
+                'content_preview': self._get_content_preview(content),
+                'url_safe_name': str(url_path.with_suffix(''))
+            }
+            return (stat.st_mtime_ns, stat.st_size, doc)
+            
+        except Exception as e:
+            print(f"Error reading {filepath}: {e}")
+            return None
+    
+    def _tree_signature(self, entries):
+        """Identify the scanned file set by path, mtime and size (stats are cached on the DirEntry)"""
+        signature = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+                signature.append((entry.path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((entry.path, None, None))
+        return tuple(signature)
+    
+    def _build_url_index(self, documents):
+        """Map every accepted URL path variant to its document"""
+        by_url = {}
+        for doc in documents:
+            by_url.setdefault(doc['url_safe_name'], doc)
+            by_url.setdefault(doc['stem'], doc)
+        
+        # Case-insensitive filename fallback; exact variants above take precedence
+        for doc in documents:
+            by_url.setdefault(doc['stem'].lower(), doc)
+        return by_url
     
-    def _make_url_safe(self, path):
-        """Convert file path to URL-safe format"""
-        return path.replace('\\', '/').replace('.md', '')
+    def _iter_markdown_files(self):
+        """Yield DirEntry objects for markdown files in root, docs and one subdirectory level"""
+        seen_files = set()
+        subdirs = []
+        
+        for top in (self.root_path, self.docs_path):
+            try:
+                with os.scandir(top) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir():
+                            if top == self.root_path and entry.name not in SCAN_SKIP_DIRS:
+                                subdirs.append(entry.path)
+                        elif entry.name.endswith('.md'):
+                            key = os.path.normpath(entry.path)
+                            if key not in seen_files:
+                                seen_files.add(key)
+                                yield entry
+            except OSError as e:
+                print(f"Error scanning {top}: {e}")
         
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as it:
+                    for entry in it:
+                        if entry.name.endswith('.md') and not entry.name.startswith('.') and entry.is_file():
+                            key = os.path.normpath(entry.path)
+                            if key not in seen_files:
+                                seen_files.add(key)
+                                yield entry
+            except OSError as e:
+                print(f"Error scanning {subdir}: {e}")
+    
+    def _format_doc_name(self, stem):
+        """Format filename stem into readable document name"""
+        name = stem.replace('_', ' ').replace('-', ' ')
+        return ' '.join(word.capitalize() for word in name.split())
+    
     def _get_content_preview(self, content):
         """Get a clean preview of document content"""
         # Remove markdown headers and get first meaningful content
@@ -128,110 +347,416 @@ class DocServer:
 
     def _get_document_priority(self, filename, content):
         """Assign priority for emergency access (lower number = higher priority)"""
-        filename_lower = filename.lower()
-        
-        # Emergency/Safety docs get highest priority
-        if any(keyword in filename_lower for keyword in ['error', 'emergency', 'safety', 'mill_lamp', 'system_test']):
-            return 1
-        # Hardware troubleshooting
-        elif any(keyword in filename_lower for keyword in ['pin', 'pressure', 'hardware', 'arduino']):
-            return 2
-        # Operations and commands
-        elif any(keyword in filename_lower for keyword in ['setup', 'command', 'deploy']):
-            return 3
-        # General documentation
-        else:
-            return 4
+        match = PRIORITY_PATTERN.match(filename.lower())
+        
+        # General documentation when no keyword group hits
+        return int(match.lastgroup[1:]) if match else 4
     
     def _categorize_document(self, filename, content):
-        """Smart categorization based on filename and content analysis"""
-        filename_lower = filename.lower()
-        content_lower = content[:500].lower()  # First 500 chars for performance
-        
-        # Emergency/Safety - highest priority
-        if any(kw in filename_lower for kw in ['error', 'emergency', 'safety', 'mill_lamp', 'fault', 'alarm']):
-            return 'Emergency'
+        """Smart categorization based on filename keywords"""
+        match = CATEGORY_PATTERN.match(filename.lower())
         
-        # Hardware/Physical systems
-        elif any(kw in filename_lower for kw in ['pin', 'hardware', 'arduino', 'pressure', 'relay', 'sensor']):
-            return 'Hardware'
-        
-        # Operations and setup
-        elif any(kw in filename_lower for kw in ['setup', 'install', 'deploy', 'config', 'command']):
-            return 'Operations'
+        # Reference materials when no keyword group hits
+        return match.lastgroup if match else 'Reference'
+    
+    def render_document(self, filepath):
+        """Return (content, html) for a document, re-rendering only when its mtime changes"""
+        mtime = os.stat(filepath).st_mtime
+        cached = self.html_cache.get(filepath)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
         
-        # Monitoring and diagnostics
-        elif any(kw in filename_lower for kw in ['monitor', 'test', 'diagnostic', 'log', 'telemetry']):
-            return 'Monitoring'
+        content = _read_document(filepath, mtime)
         
-        # Development and technical
-        elif any(kw in filename_lower for kw in ['api', 'interface', 'protocol', 'serial', 'code']):
-            return 'Development'
+        with _markdown_lock:
+            # A request may have raced the prerender thread to this document while we waited
+            cached = self.html_cache.get(filepath)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+            html = _markdown.reset().convert(content)
+            self.html_cache[filepath] = (mtime, content, html)
         
-        # Reference materials
-        else:
-            return 'Reference'
+        return content, html
     
     def get_critical_docs(self):
         """Get critical documents for emergency dashboard"""
-        if not self.documents:
-            self.scan_all_documents()
-        
-        # Group critical documents by category
-        critical_docs = {}
-        for doc in self.documents:
-            if doc['category'] in ['Emergency', 'Hardware', 'Operations']:
-                category = doc['category']
-                if category not in critical_docs:
-                    critical_docs[category] = []
-                critical_docs[category].append(doc)
-        
-        # Sort each category's docs by name and limit
-        for category in critical_docs:
-            critical_docs[category].sort(key=lambda x: x['name'])
-            critical_docs[category] = critical_docs[category][:6]  # Max 6 docs per category
-        
-        return critical_docs
+        self.documents_snapshot()
+        return self.critical_docs
+
+# Emergency/repair term mappings
+REPAIR_TERMS = {
+    'pressure': ['pressure', 'sensor', 'psi', 'pneumatic', 'air'],
+    'relay': ['relay', 'switch', 'contact', 'solenoid', 'coil'],
+    'safety': ['safety', 'mill_lamp', 'emergency', 'stop', 'interlock'],
+    'error': ['error', 'fault', 'alarm', 'warning', 'problem'],
+    'pin': ['pin', 'gpio', 'connection', 'wire', 'terminal'],
+    'power': ['power', 'voltage', 'current', 'supply', '12v', '24v'],
+    'monitor': ['monitor', 'display', 'lcd', 'screen', 'interface'],
+    'temperature': ['temperature', 'temp', 'thermal', 'heat', 'cooling'],
+    'log': ['log', 'debug', 'trace', 'output', 'telemetry'],
+    'test': ['test', 'diagnostic', 'troubleshoot', 'check', 'verify'],
+    'setup': ['setup', 'install', 'config', 'configure', 'deploy']
+}
+
+# Common problem patterns
+PROBLEM_PATTERNS = {
+    'not working': ['error', 'fault', 'broken', 'failed', 'stuck'],
+    'stuck': ['relay', 'valve', 'switch', 'mechanical'],
+    'no response': ['serial', 'communication', 'timeout', 'connection'],
+    'overheating': ['temperature', 'thermal', 'cooling', 'fan'],
+    'no power': ['power', 'voltage', 'supply', 'fuse', 'connection']
+}
+
+# One substring alternation per repair group replaces the per-term `in` scans
+REPAIR_TERM_PATTERNS = [
+    (re.compile('|'.join(re.escape(term) for term in terms)), terms)
+    for terms in REPAIR_TERMS.values()
+]
 
 def _expand_emergency_query(query):
     """Expand emergency search queries with related terms"""
     query_lower = query.lower()
-    expanded = [query]  # Always include original query
-    
-    # Emergency/repair term mappings
-    repair_terms = {
-        'pressure': ['pressure', 'sensor', 'psi', 'pneumatic', 'air'],
-        'relay': ['relay', 'switch', 'contact', 'solenoid', 'coil'],
-        'safety': ['safety', 'mill_lamp', 'emergency', 'stop', 'interlock'],
-        'error': ['error', 'fault', 'alarm', 'warning', 'problem'],
-        'pin': ['pin', 'gpio', 'connection', 'wire', 'terminal'],
-        'power': ['power', 'voltage', 'current', 'supply', '12v', '24v'],
-        'monitor': ['monitor', 'display', 'lcd', 'screen', 'interface'],
-        'temperature': ['temperature', 'temp', 'thermal', 'heat', 'cooling'],
-        'log': ['log', 'debug', 'trace', 'output', 'telemetry'],
-        'test': ['test', 'diagnostic', 'troubleshoot', 'check', 'verify'],
-        'setup': ['setup', 'install', 'config', 'configure', 'deploy']
-    }
+    expanded = {query: None}  # Always include original query; dict keys dedupe and keep order
     
     # Add related terms based on query content
-    for category, terms in repair_terms.items():
-        if any(term in query_lower for term in terms):
-            expanded.extend([t for t in terms if t not in expanded])
-    
-    # Add common problem patterns
-    problem_patterns = {
-        'not working': ['error', 'fault', 'broken', 'failed', 'stuck'],
-        'stuck': ['relay', 'valve', 'switch', 'mechanical'],
-        'no response': ['serial', 'communication', 'timeout', 'connection'],
-        'overheating': ['temperature', 'thermal', 'cooling', 'fan'],
-        'no power': ['power', 'voltage', 'supply', 'fuse', 'connection']
-    }
+    for pattern, terms in REPAIR_TERM_PATTERNS:
+        if pattern.search(query_lower):
+            expanded.update(dict.fromkeys(terms))
     
-    for pattern, terms in problem_patterns.items():
+    for pattern, terms in PROBLEM_PATTERNS.items():
         if pattern in query_lower:
-            expanded.extend([t for t in terms if t not in expanded])
+            expanded.update(dict.fromkeys(terms))
     
-    return expanded
+    return list(expanded)
+
+_LINE_END_CR = re.compile(r'\r$', re.MULTILINE)
+
+def _find_line_matches(content, pattern, limit=5):
+    """Find up to `limit` matching lines as (line_num, line, context) tuples.
+    
+    Jumps from hit to hit with pattern.search and slices two lines of context on
+    either side without splitting the document. `content` may be a str or a bytes
+    buffer such as an mmap; bytes results are decoded on the way out.
+    """
+    is_text = isinstance(content, str)
+    newline = '\n' if is_text else b'\n'
+    size = len(content)
+    hits = []
+    line_index = 0
+    pos = 0
+    
+    while len(hits) < limit:
+        m = pattern.search(content, pos)
+        if not m:
+            break
+        if is_text:
+            line_index += content.count(newline, pos, m.start())
+        else:
+            line_index += content[pos:m.start()].count(newline)
+        line_start = content.rfind(newline, 0, m.start()) + 1
+        line_end = content.find(newline, m.end())
+        if line_end == -1:
+            line_end = size
+        
+        # Widen to two lines either side of the match
+        start = line_start
+        for _ in range(2):
+            if start == 0:
+                break
+            start = content.rfind(newline, 0, start - 1) + 1
+        end = line_end
+        for _ in range(2):
+            if end >= size:
+                break
+            end = content.find(newline, end + 1)
+            if end == -1:
+                end = size
+        
+        line = content[line_start:line_end]
+        context = content[start:end]
+        if not is_text:
+            # Match text-mode reads, which translate CRLF line endings
+            line = line.decode('utf-8', errors='ignore').rstrip('\r')
+            context = _LINE_END_CR.sub('', context.decode('utf-8', errors='ignore'))
+        hits.append((line_index + 1, line, context))
+        
+        # Resume at the start of the next line
+        pos = line_end + 1
+        line_index += 1
+    
+    return hits
+
+_ports_cache = (0.0, [])  # (monotonic time, comports() result)
+
+def _list_ports_cached():
+    """Enumerate serial ports, reusing the last result for PORTS_CACHE_SECONDS"""
+    global _ports_cache
+    checked, ports = _ports_cache
+    now = time.monotonic()
+    if not checked or now - checked > PORTS_CACHE_SECONDS:
+        ports = list(serial.tools.list_ports.comports())
+        _ports_cache = (now, ports)
+    return ports
+
+_serial_pool = {}  # port -> [Serial, lock, last_used]; handles stay open between wizard commands
+_serial_pool_lock = threading.Lock()
+_serial_open_locks = {}  # port -> lock held while that port is being opened
+
+def _pooled_serial(port):
+    """Return the open pooled (Serial, lock) for a port and mark it used, or None (caller holds _serial_pool_lock)"""
+    entry = _serial_pool.get(port)
+    if entry is None or not entry[0].is_open:
+        return None
+    entry[2] = time.monotonic()  # Updated under the pool lock so the idle release never closes a handle in use
+    return entry[0], entry[1]
+
+def _get_serial(port):
+    """Return the pooled (Serial, lock) for a port, opening it on first use"""
+    with _serial_pool_lock:
+        pooled = _pooled_serial(port)
+        if pooled:
+            return pooled
+        open_lock = _serial_open_locks.setdefault(port, threading.Lock())
+    
+    # Open and wait out the Arduino reset without holding the pool lock, so other ports' idle releases still run
+    with open_lock:
+        with _serial_pool_lock:
+            pooled = _pooled_serial(port)
+            if pooled:
+                return pooled  # Another request opened it while we waited
+        ser = _open_serial(port)
+        with _serial_pool_lock:
+            _serial_pool[port] = [ser, threading.Lock(), 0]
+            return _pooled_serial(port)
+
+def _open_serial(port):
+    """Open a controller port and wait for the Arduino to come out of reset"""
+    ser = serial.Serial(port, 115200, timeout=3)
+    try:
+        if sys.platform.startswith('linux'):
+            # Set ASYNC_LOW_LATENCY so USB-serial adapters don't hold bytes for their latency timer
+            try:
+                ser.set_low_latency_mode(True)
+            except (IOError, ValueError, NotImplementedError):
+                pass  # Driver doesn't support the flag
+        time.sleep(2)  # Opening the port resets the Arduino; wait for it to initialize
+    except BaseException:
+        ser.close()  # Never leak a port that didn't make it into the pool
+        raise
+    return ser
+
+def _release_serial_later(port):
+    """Schedule the idle check that gives the port back to other programs"""
+    timer = threading.Timer(SERIAL_IDLE_SECONDS, _release_idle_serial, args=(port,))
+    timer.daemon = True
+    timer.start()
+
+def _release_idle_serial(port):
+    """Close a pooled handle that has not been used for SERIAL_IDLE_SECONDS"""
+    with _serial_pool_lock:
+        entry = _serial_pool.get(port)
+        if entry is None or time.monotonic() - entry[2] < SERIAL_IDLE_SECONDS:
+            return  # Already gone, or a newer command scheduled its own check
+        if not entry[1].acquire(blocking=False):
+            return  # A command is still running; it schedules another check when done
+        try:
+            del _serial_pool[port]
+            entry[0].close()
+        finally:
+            entry[1].release()
+
+def _drop_serial(port, ser):
+    """Close a failed handle and forget it so the next command reconnects"""
+    with _serial_pool_lock:
+        if _serial_pool.get(port, [None])[0] is ser:
+            del _serial_pool[port]
+    try:
+        ser.close()
+    except Exception:
+        pass
+
+def _is_response_end(line):
+    """True for a complete (newline-terminated) prompt or completion line"""
+    return line.endswith('>') or 'Complete' in line
+
+def _read_response(ser, timeout=3):
+    """Read response lines until the prompt or a completion line, blocking in the driver instead of polling"""
+    response_lines = []
+    buffer = bytearray()
+    deadline = time.monotonic() + timeout
+    if ser.timeout != timeout:
+        ser.timeout = timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Setting the timeout reconfigures the port, so only shrink it once the deadline is 0.1 s closer
+        if ser.timeout - remaining > 0.1:
+            ser.timeout = remaining
+        chunk = ser.read(ser.in_waiting or 1)  # Returns as soon as any byte arrives
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, partial = buffer.split(b'\n')
+        buffer = bytearray(partial)
+        for raw in lines:
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                response_lines.append(line)
+            if _is_response_end(line):
+                return response_lines
+        # The prompt is not newline-terminated; any other unfinished line is still arriving
+        if buffer.strip() == b'>':
+            break
+    
+    line = buffer.decode('utf-8', errors='ignore').strip()
+    if line:
+        response_lines.append(line)
+    return response_lines
+
+def _close_serial_pool():
+    """Close every pooled serial handle"""
+    with _serial_pool_lock:
+        for entry in _serial_pool.values():
+            entry[0].close()
+        _serial_pool.clear()
+
+atexit.register(_close_serial_pool)
+
+class WizardLogWriter:
+    """Shared daily append-only wizard log with a persistent buffered handle, fed by a background flusher"""
+    
+    def __init__(self, log_dir, idle_seconds=WIZARD_LOG_IDLE_SECONDS):
+        self.log_dir = log_dir
+        self.idle_seconds = idle_seconds
+        self.handles = {}  # log path -> [file, lock, last_used]
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()  # (log path, line, urgent)
+        self.flusher = None
+        self.stopping = threading.Event()
+    
+    def enqueue(self, line, urgent=False):
+        """Queue a line for the background flusher and return without touching the disk"""
+        if self.flusher is None:
+            self._start_flusher()
+        self.queue.put((self.log_path(), line, urgent))
+    
+    def _start_flusher(self):
+        """Start the daemon thread that drains the queue"""
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self.flusher.start()
+    
+    def _flush_loop(self):
+        """Drain queued lines every WIZARD_LOG_DRAIN_SECONDS and flush files periodically"""
+        last_flush = time.monotonic()
+        while not self.stopping.is_set():
+            try:
+                first = self.queue.get(timeout=WIZARD_LOG_DRAIN_SECONDS)
+            except queue.Empty:
+                first = None
+            
+            force = self.drain(first)
+            if force or time.monotonic() - last_flush >= WIZARD_LOG_FLUSH_SECONDS:
+                self.flush_all()
+                last_flush = time.monotonic()
+    
+    def drain(self, first=None):
+        """Write up to WIZARD_LOG_BATCH queued lines with one write per file; True means flush now"""
+        batch = {}
+        count = 0
+        urgent = False
+        item = first
+        while True:
+            if item is not None:
+                path, line, is_urgent = item
+                batch.setdefault(path, []).append(line)
+                urgent = urgent or is_urgent
+                count += 1
+            if count >= WIZARD_LOG_BATCH:
+                break
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        
+        for path, lines in batch.items():
+            try:
+                self.append(path, ''.join(lines))
+            except Exception as e:
+                print(f"Error writing wizard log {path}: {e}")
+        return urgent or count >= WIZARD_LOG_BATCH
+    
+    def log_path(self):
+        """Path of today's .jsonl log; every session appends to it, tagged by session_id"""
+        return os.path.join(self.log_dir, f"wizard_sessions_{datetime.now():%Y%m%d}.jsonl")
+    
+    def append(self, path, line):
+        """Buffer lines for a log file; the file stays open between events"""
+        data = line.encode('utf-8')
+        while True:
+            entry = self._get_handle(path)
+            with entry[1]:
+                # An idle sweep may have closed this handle after we looked it up
+                if not entry[0].closed:
+                    entry[0].write(data)
+                    return
+    
+    def _get_handle(self, path):
+        """Look up or lazily open the handle for a log file"""
+        with self.lock:
+            entry = self.handles.get(path)
+            if entry is None or entry[0].closed:
+                # Also retires yesterday's file once it has been idle long enough
+                self._close_idle()
+                try:
+                    handle = open(path, 'ab', buffering=64 * 1024)
+                except FileNotFoundError:
+                    # Log directory is created at startup; recreate it if it went missing
+                    os.makedirs(self.log_dir, exist_ok=True)
+                    handle = open(path, 'ab', buffering=64 * 1024)
+                entry = [handle, threading.Lock(), 0]
+                self.handles[path] = entry
+            entry[2] = time.monotonic()
+            return entry
+    
+    def _close_idle(self):
+        """Close handles that have not been written to recently (caller holds self.lock)"""
+        cutoff = time.monotonic() - self.idle_seconds
+        for path, entry in list(self.handles.items()):
+            if entry[2] < cutoff:
+                with entry[1]:
+                    entry[0].close()
+                del self.handles[path]
+    
+    def flush_all(self):
+        """Push buffered lines for every open log file to disk"""
+        with self.lock:
+            entries = list(self.handles.values())
+        for entry in entries:
+            with entry[1]:
+                if not entry[0].closed:
+                    entry[0].flush()
+    
+    def close_all(self):
+        """Stop the flusher, write out anything still queued, then flush and close every handle"""
+        # The flusher may hold a batch it already took off the queue; let it write that before closing
+        self.stopping.set()
+        with self.lock:
+            flusher = self.flusher
+        if flusher is not None:
+            flusher.join()
+        while self.drain():
+            pass
+        with self.lock:
+            for entry in self.handles.values():
+                with entry[1]:
+                    entry[0].close()
+            self.handles.clear()
+
+wizard_log_writer = WizardLogWriter(WIZARD_LOG_DIR)
+atexit.register(wizard_log_writer.close_all)
 
 # Create global doc server instance
 doc_server = DocServer(ROOT_PATH, DOCS_PATH)
@@ -240,33 +765,18 @@ doc_server = DocServer(ROOT_PATH, DOCS_PATH)
 def index():
     """Main documentation dashboard"""
     try:
-        all_docs = doc_server.scan_all_documents()
-        
-        # Group documents by category
-        categories = {}
-        for doc in all_docs:
-            cat = doc['category']
-            if cat not in categories:
-                categories[cat] = []
-            categories[cat].append(doc)
-        
-        # Get recently modified docs (last 7 days)
-        recent_docs = []
-        seven_days_ago = datetime.now().timestamp() - (7 * 24 * 3600)
-        for doc in all_docs:
-            if doc['modified'].timestamp() > seven_days_ago:
-                recent_docs.append(doc)
-        recent_docs.sort(key=lambda x: x['modified'], reverse=True)
-        recent_docs = recent_docs[:8]  # Top 8 most recent
-        
-        # Get emergency docs
-        emergency_docs = [doc for doc in all_docs if doc['category'] == 'Emergency']
+        all_docs = doc_server.documents_snapshot()
+        
+        # Get recently modified docs (last 7 days) from the scan's newest-first list
+        seven_days_ago = time.time() - (7 * 24 * 3600)
+        recent_docs = [doc for doc in doc_server.recent_docs
+                       if doc['mtime'] > seven_days_ago]
         
         return render_template('index_new.html', 
-                             categories=categories,
+                             categories=doc_server.by_category,
                              category_info=doc_server.categories,
                              recent_docs=recent_docs,
-                             emergency_docs=emergency_docs,
+                             emergency_docs=doc_server.by_category.get('Emergency', []),
                              total_docs=len(all_docs),
                              scan_time=doc_server.last_scan.strftime('%Y-%m-%d %H:%M:%S'))
     except Exception as e:
@@ -277,40 +787,14 @@ def view_document(doc_path):
     """View individual document with smart path handling"""
     try:
         # Find the document in our scanned list
-        all_docs = doc_server.scan_all_documents()
-        document = None
-        
-        # Try multiple matching strategies
-        for doc in all_docs:
-            if (doc['url_safe_name'] == doc_path or 
-                doc['filename'].replace('.md', '') == doc_path or
-                doc['relative_path'].replace('.md', '') == doc_path or
-                doc['relative_path'].replace('\\', '/').replace('.md', '') == doc_path):
-                document = doc
-                break
-        
-        if not document:
-            # Try to find by filename alone
-            for doc in all_docs:
-                if doc['filename'].replace('.md', '').lower() == doc_path.lower():
-                    document = doc
-                    break
+        all_docs = doc_server.documents_snapshot()
+        document = doc_server.by_url.get(doc_path) or doc_server.by_url.get(doc_path.lower())
         
         if not document:
             return render_template('404.html', doc_path=doc_path), 404
         
-        # Read and process the document
-        with open(document['filepath'], 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # Render markdown with extensions
-        md = markdown.Markdown(extensions=[
-            'markdown.extensions.tables',
-            'markdown.extensions.fenced_code', 
-            'markdown.extensions.toc',
-            'markdown.extensions.codehilite'
-        ])
-        html_content = md.convert(content)
+        # Read and render the document (cached until the file changes)
+        content, html_content = doc_server.render_document(document['filepath'])
         
         # Get related documents in same category
         related_docs = [doc for doc in all_docs 
@@ -339,11 +823,11 @@ def emergency_dashboard():
 def emergency_diagnostic():
     """Interactive Emergency Diagnostic Wizard"""
     try:
-        # Get all documents for potential recommendations
-        all_docs = doc_server.scan_all_documents()
+        doc_server.documents_snapshot()
         
-        # Filter for emergency and troubleshooting docs
-        emergency_docs = [doc for doc in all_docs if doc['category'] in ['Emergency', 'Hardware', 'Operations']]
+        # Emergency and troubleshooting docs, in category priority order
+        emergency_docs = [doc for category in ['Emergency', 'Hardware', 'Operations']
+                          for doc in doc_server.by_category.get(category, [])]
         
         return render_template('emergency_diagnostic.html', emergency_docs=emergency_docs)
     except Exception as e:
@@ -357,40 +841,42 @@ def search():
         results = []
         
         if query:
-            docs = doc_server.scan_all_documents()
+            docs = doc_server.documents_snapshot()
             
             # Smart query expansion for common repair terms
             expanded_query = _expand_emergency_query(query)
             
+            # One case-insensitive alternation replaces per-line, per-term substring tests
+            term_pattern = re.compile('|'.join(re.escape(term) for term in expanded_query), re.IGNORECASE)
+            byte_pattern = None  # Compiled on first large document
+            
             for doc in docs:
                 try:
-                    with open(doc['filepath'], 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
                     # Check for matches with expanded query terms
                     match_score = 0
                     matches = []
                     
                     # Primary match in title/filename (highest priority)
-                    if any(term.lower() in doc['name'].lower() for term in expanded_query):
+                    if term_pattern.search(doc['name']):
                         match_score += 10
                     
-                    # Content matches
-                    lines = content.split('\n')
-                    for i, line in enumerate(lines):
-                        if any(term.lower() in line.lower() for term in expanded_query):
-                            match_score += 1
-                            # Get context around match
-                            start = max(0, i-2)
-                            end = min(len(lines), i+3)
-                            context = '\n'.join(lines[start:end])
-                            matches.append({
-                                'line_num': i+1,
-                                'context': context,
-                                'matched_line': line.strip()
-                            })
-                            if len(matches) >= 5:  # Limit matches per document
-                                break
+                    # Content matches - large files are scanned from an mmap instead of a decoded copy
+                    if doc['size'] > LARGE_DOC_BYTES:
+                        if byte_pattern is None:
+                            byte_pattern = re.compile(b'|'.join(re.escape(term.encode('utf-8')) for term in expanded_query), re.IGNORECASE)
+                        with open(doc['filepath'], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                            hits = _find_line_matches(buffer, byte_pattern)
+                    else:
+                        content = _read_document(doc['filepath'], doc['mtime'])
+                        hits = _find_line_matches(content, term_pattern)
+                    
+                    for line_num, line, context in hits:
+                        match_score += 1
+                        matches.append({
+                            'line': line_num,
+                            'context': context,
+                            'text': line.strip()
+                        })
                     
                     if match_score > 0:
                         results.append({
@@ -419,21 +905,35 @@ def view_raw(filename):
         if not filename.endswith('.md'):
             filename += '.md'
         
-        filepath = os.path.join(DOCS_PATH, filename)
-        if not os.path.exists(filepath):
-            return f"<h1>Document not found: {filename}</h1>", 404
+        filepath = os.path.normpath(os.path.join(DOCS_PATH, filename))
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Scanned documents already carry their stat info and category; only unknown files touch the disk
+        doc_server.documents_snapshot()
+        cached = doc_server.docs_cache.get(filepath)
+        if cached:
+            size, doc = cached[1], cached[2]
+            mtime = doc['mtime']
+            category = doc['category']
+            url_safe_name = doc['url_safe_name']
+            content = _read_document(filepath, mtime)
+        else:
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                return f"<h1>Document not found: {filename}</h1>", 404
+            mtime, size = stat.st_mtime, stat.st_size
+            content = _read_document(filepath, mtime)
+            category = doc_server._categorize_document(filename, content)
+            url_safe_name = str(PurePosixPath(DOCS_PATH, filename).with_suffix(''))
         
         # Get document info
-        stat = os.path.stat(filepath)
         document = {
             'name': filename.replace('.md', '').replace('_', ' ').title(),
             'filename': filename,
-            'category': doc_server._categorize_document(filename, content),
-            'size_kb': round(stat.st_size / 1024, 1),
-            'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
+            'url_safe_name': url_safe_name,
+            'category': category,
+            'size_kb': round(size / 1024, 1),
+            'modified': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
         }
         
         return render_template('raw.html', document=document, content=content)
@@ -444,18 +944,11 @@ def view_raw(filename):
 def system_status():
     """System status page"""
     try:
-        docs = doc_server.scan_all_documents()
+        docs = doc_server.documents_snapshot()
         
         # Calculate system statistics
         uptime = str(datetime.now() - datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
         total_docs = len(docs)
-        categories = {}
-        total_size_kb = 0
-        
-        for doc in docs:
-            category = doc['category']
-            categories[category] = categories.get(category, 0) + 1
-            total_size_kb += doc.get('size_kb', 0)
         
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         if doc_server.last_scan:
@@ -469,8 +962,8 @@ def system_status():
         return render_template('system.html',
                              uptime=uptime,
                              total_docs=total_docs,
-                             categories=categories,
-                             total_size_kb=int(total_size_kb),
+                             categories=doc_server.category_counts,
+                             total_size_kb=int(doc_server.total_size_kb),
                              current_time=current_time,
                              last_scan=last_scan)
     except Exception as e:
@@ -484,14 +977,18 @@ def run_command():
         command = data.get('command', '').strip()
         
         # All commands allowed - safety handled by wizard UI
-        import serial
-        import time
-        import serial.tools.list_ports
+        if not SERIAL_AVAILABLE:
+            return jsonify({
+                'success': False,
+                'error': 'Serial support not available',
+                'suggestion': 'Install pyserial (pip install pyserial) to run controller commands'
+            }), 500
         
         try:
             # Auto-detect Arduino port
             arduino_port = None
-            for port in serial.tools.list_ports.comports():
+            ports = _list_ports_cached()
+            for port in ports:
                 if 'Arduino' in port.description or 'CH340' in port.description or 'USB' in port.description:
                     arduino_port = port.device
                     break
@@ -501,35 +998,29 @@ def run_command():
                     'success': False,
                     'error': 'Arduino controller not found',
                     'suggestion': 'Connect Arduino via USB cable and ensure drivers are installed',
-                    'available_ports': [p.device for p in serial.tools.list_ports.comports()]
+                    'available_ports': [p.device for p in ports]
                 }), 404
             
-            # Connect to Arduino
-            ser = serial.Serial(arduino_port, 115200, timeout=3)
-            time.sleep(2)  # Wait for Arduino to initialize
-            
-            # Clear any existing data
-            ser.flushInput()
-            ser.flushOutput()
-            
-            # Send command
-            ser.write(f'{command}\r\n'.encode())
-            time.sleep(0.5)  # Wait for processing
-            
-            # Read response
-            response_lines = []
-            start_time = time.time()
-            while time.time() - start_time < 3:  # 3 second timeout
-                if ser.in_waiting > 0:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        response_lines.append(line)
-                    if line.endswith('>') or 'Complete' in line:  # Command prompt or completion
-                        break
-                else:
-                    time.sleep(0.1)
-            
-            ser.close()
+            # Reuse the open connection; only the first command pays the port open and Arduino reset
+            ser, ser_lock = _get_serial(arduino_port)
+            try:
+                with ser_lock:
+                    try:
+                        # Clear any existing data
+                        ser.reset_input_buffer()
+                        ser.reset_output_buffer()
+                        
+                        # Send command
+                        ser.write(f'{command}\r\n'.encode())
+                        
+                        # Read response (3 second timeout)
+                        response_lines = _read_response(ser, 3)
+                    except serial.SerialException:
+                        _drop_serial(arduino_port, ser)
+                        raise
+            finally:
+                # Whatever happened, give the port back to other programs once it goes idle
+                _release_serial_later(arduino_port)
             
             response = '\n'.join(response_lines) if response_lines else 'No response received'
             
@@ -575,21 +1066,15 @@ def log_wizard_session():
             'data': data.get('data', {})
         }
         
-        # Auto-save to local file
-        import os
-        log_dir = 'wizard_logs'
-        os.makedirs(log_dir, exist_ok=True)
-        
-        log_file = os.path.join(log_dir, f"wizard_session_{data.get('session_id', 'unknown')}.jsonl")
-        
-        with open(log_file, 'a') as f:
-            import json
-            f.write(json.dumps(log_entry) + '\n')
+        # Auto-save to local file; the background flusher does the disk I/O, command errors and session ends are flushed at once
+        wizard_log_writer.enqueue(json.dumps(log_entry, separators=(',', ':')) + '\n',
+                                  urgent=log_entry['event_type'] in WIZARD_LOG_URGENT_EVENTS)
         
         return jsonify({
             'success': True,
             'logged': True,
-            'log_file': log_file
+            'queued': True,  # Written by the background flusher, not yet on disk
+            'log_file': wizard_log_writer.log_path()
         })
         
     except Exception as e:
@@ -626,13 +1111,22 @@ if __name__ == '__main__':
     # Ensure directories exist
     os.makedirs('templates', exist_ok=True)
     os.makedirs('static/css', exist_ok=True)
+    os.makedirs(WIZARD_LOG_DIR, exist_ok=True)
+    
+    # SIGTERM skips atexit by default; exit normally so buffered wizard logs are written out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     
     # Perform initial document scan
     print("🔍 Scanning documents...")
     docs = doc_server.scan_all_documents()
-    print(f"✅ Found {len(docs)} documents in {len(set(doc['category'] for doc in docs))} categories")
+    print(f"✅ Found {len(docs)} documents in {len(doc_server.category_counts)} categories")
     
     try:
-        app.run(host='0.0.0.0', port=PORT, debug=DEBUG)
+        if WAITRESS_AVAILABLE and not DEBUG:
+            # Production WSGI server: a slow run_command serial exchange no longer holds up other requests
+            print(f"🚀 Serving with waitress ({SERVER_THREADS} threads)")
+            serve(app, host='0.0.0.0', port=PORT, threads=SERVER_THREADS)
+        else:
+            app.run(host='0.0.0.0', port=PORT, debug=DEBUG, threaded=True)
     except Exception as e:
         print(f"❌ Server startup error: {e}")
\ No newline at end of file
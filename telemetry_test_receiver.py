@@ -24,6 +24,8 @@ import serial.tools.list_ports
 import sys
 import time
 import struct
+import queue
+import threading
 from datetime import datetime
 
 # Protobuf message type definitions (matching telemetry.proto)
@@ -36,6 +38,21 @@ class MessageType:
     SEQUENCE_EVENT = 0x06
     ERROR_EVENT = 0x07
 
+# Precompiled little-endian field layouts
+UINT16_FIELD = struct.Struct('<H')
+PRESSURE_FIELDS = struct.Struct('<HH')  # raw, psi
+
+# Fixed-width LCD labels per message type
+LCD_TYPE_NAMES = {
+    MessageType.SYSTEM_STATUS: "STATUS",
+    MessageType.DIGITAL_INPUT: "INPUT ",
+    MessageType.DIGITAL_OUTPUT: "OUTPUT",
+    MessageType.RELAY_CONTROL: "RELAY ",
+    MessageType.PRESSURE_READING: "PRESS ",
+    MessageType.SEQUENCE_EVENT: "EVENT ",
+    MessageType.ERROR_EVENT: "ERROR "
+}
+
 class TelemetryReceiver:
     def __init__(self, port=None, baud=115200):
         self.port = port or self.auto_detect_arduino()
@@ -44,6 +61,18 @@ class TelemetryReceiver:
         self.messages_received = 0
         self.bytes_received = 0
         self.last_sequence_id = None
+        self.frames = queue.SimpleQueue()  # Complete message payloads from the reader thread
+        self.reader = None
+        self.running = False
+        
+        # Message type -> decoder lookup (one dict probe per message)
+        self.decoders = {
+            MessageType.SYSTEM_STATUS: self.decode_system_status,
+            MessageType.DIGITAL_INPUT: self.decode_digital_input,
+            MessageType.DIGITAL_OUTPUT: self.decode_digital_output,
+            MessageType.RELAY_CONTROL: self.decode_relay_control,
+            MessageType.PRESSURE_READING: self.decode_pressure_reading
+        }
         
     def auto_detect_arduino(self):
         """Auto-detect Arduino controller COM port"""
@@ -64,6 +93,9 @@ class TelemetryReceiver:
         """Connect to the telemetry serial port"""
         try:
             self.ser = serial.Serial(self.port, self.baud, timeout=1)
+            if hasattr(self.ser, 'set_buffer_size'):
+                # Windows only: enlarge driver RX buffer so bursts survive console stalls
+                self.ser.set_buffer_size(rx_size=65536, tx_size=4096)
             time.sleep(2)  # Wait for Arduino initialization
             print(f"✅ Connected to {self.port} at {self.baud} baud")
             print(f"📡 Waiting for telemetry data from pins A4/A5...")
@@ -72,31 +104,47 @@ class TelemetryReceiver:
             print(f"❌ Connection failed: {e}")
             return False
     
-    def read_message(self):
-        """Read and decode a single telemetry message"""
-        try:
-            # Read message size byte
-            size_byte = self.ser.read(1)
-            if not size_byte:
-                return None
-            
-            message_size = size_byte[0]
-            if message_size == 0 or message_size > 50:  # Sanity check
-                return None
-            
-            # Read message data
-            message_data = self.ser.read(message_size)
-            if len(message_data) != message_size:
-                return None
-            
-            self.messages_received += 1
-            self.bytes_received += message_size + 1
-            
-            return self.decode_message(message_data)
+    def start_reader(self):
+        """Start the thread that drains the serial port independently of console output"""
+        self.running = True
+        self.reader = threading.Thread(target=self.reader_loop, daemon=True)
+        self.reader.start()
+    
+    def reader_loop(self):
+        """Read whatever the port has buffered in one call and split it into size-prefixed frames"""
+        buffer = bytearray()
+        while self.running:
+            try:
+                buffer += self.ser.read(self.ser.in_waiting or 1)
+            except Exception as e:
+                if self.running:
+                    print(f"⚠️  Read error: {e}")
+                    self.running = False
+                return
             
-        except Exception as e:
-            print(f"⚠️  Read error: {e}")
+            consumed = 0
+            while consumed < len(buffer):
+                message_size = buffer[consumed]
+                if message_size == 0 or message_size > 50:  # Sanity check - skip byte to resync
+                    consumed += 1
+                    continue
+                if len(buffer) - consumed - 1 < message_size:
+                    break  # Wait for the rest of the frame
+                self.frames.put(bytes(buffer[consumed + 1:consumed + 1 + message_size]))
+                consumed += message_size + 1
+            del buffer[:consumed]
+    
+    def read_message(self, timeout=1):
+        """Decode the next telemetry message from the reader thread, or None after `timeout` seconds"""
+        try:
+            message_data = self.frames.get(timeout=timeout)
+        except queue.Empty:
             return None
+        
+        self.messages_received += 1
+        self.bytes_received += len(message_data) + 1
+        
+        return self.decode_message(message_data)
     
     def decode_message(self, data):
         """Decode protobuf message (simplified decoder)"""
@@ -105,8 +153,8 @@ class TelemetryReceiver:
         
         # Basic protobuf field extraction (simplified)
         msg_type = data[0]
-        sequence_id = data[1] if len(data) > 1 else 0
-        timestamp = struct.unpack('<H', data[2:4])[0] if len(data) >= 4 else 0
+        sequence_id = data[1]
+        timestamp = UINT16_FIELD.unpack_from(data, 2)[0]
         
         # Validate sequence
         if self.last_sequence_id is not None:
@@ -124,16 +172,9 @@ class TelemetryReceiver:
         }
         
         # Decode specific message types
-        if msg_type == MessageType.SYSTEM_STATUS:
-            message['decoded'] = self.decode_system_status(data)
-        elif msg_type == MessageType.DIGITAL_INPUT:
-            message['decoded'] = self.decode_digital_input(data)
-        elif msg_type == MessageType.DIGITAL_OUTPUT:
-            message['decoded'] = self.decode_digital_output(data)
-        elif msg_type == MessageType.RELAY_CONTROL:
-            message['decoded'] = self.decode_relay_control(data)
-        elif msg_type == MessageType.PRESSURE_READING:
-            message['decoded'] = self.decode_pressure_reading(data)
+        decoder = self.decoders.get(msg_type)
+        if decoder:
+            message['decoded'] = decoder(data)
         else:
             message['decoded'] = f"Unknown message type: 0x{msg_type:02X}"
         
@@ -142,10 +183,10 @@ class TelemetryReceiver:
     def decode_system_status(self, data):
         """Decode system status message"""
         if len(data) >= 8:
-            system_state = data[4] if len(data) > 4 else 0
-            mill_lamp_state = data[5] if len(data) > 5 else 0
-            error_count = data[6] if len(data) > 6 else 0
-            uptime_s = struct.unpack('<H', data[6:8])[0] if len(data) >= 8 else 0
+            system_state = data[4]
+            mill_lamp_state = data[5]
+            error_count = data[6]
+            uptime_s = UINT16_FIELD.unpack_from(data, 6)[0]
             
             return f"System: {system_state}, Mill Lamp: {mill_lamp_state}, Errors: {error_count}, Uptime: {uptime_s}s"
         return "System Status (partial)"
@@ -153,49 +194,40 @@ class TelemetryReceiver:
     def decode_digital_input(self, data):
         """Decode digital input message"""
         if len(data) >= 6:
-            pin = data[4] if len(data) > 4 else 0
-            state = data[5] if len(data) > 5 else 0
+            pin = data[4]
+            state = data[5]
             return f"Input Pin {pin}: {'HIGH' if state else 'LOW'}"
         return "Digital Input (partial)"
     
     def decode_digital_output(self, data):
         """Decode digital output message"""
         if len(data) >= 6:
-            pin = data[4] if len(data) > 4 else 0
-            state = data[5] if len(data) > 5 else 0
+            pin = data[4]
+            state = data[5]
             return f"Output Pin {pin}: {'HIGH' if state else 'LOW'}"
         return "Digital Output (partial)"
     
     def decode_relay_control(self, data):
         """Decode relay control message"""
         if len(data) >= 6:
-            relay = data[4] if len(data) > 4 else 0
-            state = data[5] if len(data) > 5 else 0
+            relay = data[4]
+            state = data[5]
             return f"Relay {relay}: {'ON' if state else 'OFF'}"
         return "Relay Control (partial)"
     
     def decode_pressure_reading(self, data):
         """Decode pressure reading message"""
         if len(data) >= 8:
-            pressure_raw = struct.unpack('<H', data[4:6])[0] if len(data) >= 6 else 0
-            pressure_psi = struct.unpack('<H', data[6:8])[0] if len(data) >= 8 else 0
+            pressure_raw, pressure_psi = PRESSURE_FIELDS.unpack_from(data, 4)
             return f"Pressure: {pressure_psi} PSI (raw: {pressure_raw})"
         return "Pressure Reading (partial)"
     
     def display_lcd_format(self, message):
         """Display message in simulated LCD format"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        msg_type_names = {
-            0x01: "STATUS",
-            0x02: "INPUT ",
-            0x03: "OUTPUT",
-            0x04: "RELAY ",
-            0x05: "PRESS ",
-            0x06: "EVENT ",
-            0x07: "ERROR "
-        }
-        
-        type_name = msg_type_names.get(message['type'], f"0x{message['type']:02X}")
+        type_name = LCD_TYPE_NAMES.get(message['type'])
+        if type_name is None:
+            type_name = f"0x{message['type']:02X}"
         
         # Simulate 20x4 LCD display
         print(f"┌────────────────────┐")
@@ -224,8 +256,10 @@ class TelemetryReceiver:
 Press Ctrl+C to stop monitoring...
         """)
         
+        self.start_reader()
+        
         try:
-            while True:
+            while self.running:
                 message = self.read_message()
                 if message:
                     self.display_lcd_format(message)
@@ -235,10 +269,9 @@ Press Ctrl+C to stop monitoring...
                           f"Size={message['size']}, Raw={message['raw_data']}")
                     print("-" * 50)
                 else:
-                    # No data received, show heartbeat
+                    # No data received, show heartbeat (queue timeout already paced the loop)
                     print(f"⏱️  {datetime.now().strftime('%H:%M:%S')} - Waiting for data... "
                           f"(Received: {self.messages_received} msgs, {self.bytes_received} bytes)")
-                    time.sleep(1)
                     
         except KeyboardInterrupt:
             print(f"\n\n📊 Session Summary:")
@@ -248,6 +281,7 @@ Press Ctrl+C to stop monitoring...
             print(f"✅ Telemetry receiver stopped.")
         
         finally:
+            self.running = False
             if self.ser:
                 self.ser.close()
 